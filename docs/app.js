@@ -1,7 +1,9 @@
 // docs/app.js
 (async function () {
   // ── Load data ────────────────────────────────────────────────────────
-  const videos = await fetch("data/videos.json", { cache: "no-store" }).then(r => r.json());
+  // "no-cache" revalidates (ETag → 304) instead of re-downloading the whole
+  // catalogue on every visit; the bot only changes it once a day.
+  const videos = await fetch("data/videos.json", { cache: "no-cache" }).then(r => r.json());
 
   const norm = v => (v == null ? "" : String(v));
   videos.forEach(v => {
@@ -1,8 +1,8 @@
 """
 Rebuild docs/data/videos.json for the CS2 POV site.
 
-All channels are processed in one loop. Behaviour depends on whether the
-channel is in SPLIT_CHANNELS:
+Channels are scanned concurrently, one worker each. Behaviour depends on
+whether the channel is in SPLIT_CHANNELS:
 
   Normal channels (lim, pov_highlights, nebula):
     • Shorts are skipped.
@@ -13,12 +13,26 @@ channel is in SPLIT_CHANNELS:
     • Shorts  → channel: "utility"
     • Long    → channel: "strategy"
     • No player detection; video is only kept when a map is found in the title.
+
+Runs are incremental: each channel is only paged back to the newest video
+already in videos.json (re-checking that day), and older rows are carried
+over. Players are re-detected across the whole catalogue every run.
+
+The trade-off: carried-over rows are never re-checked against YouTube, so
+an older video that is deleted, made private or retitled keeps its old row
+(and the player read from its old title) until the next full rebuild. Set
+FULL_REBUILD=1 to rescan every channel back to CUTOFF; the workflow does
+this every Sunday and on demand.
 """
 
 from googleapiclient.discovery import build
-from dateutil.parser import isoparse
+from googleapiclient.errors import HttpError
 from pathlib import Path
-from collections import Counter
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import datetime as dt
 import json, os, re, requests
 
@@ -40,22 +54,31 @@ CHANNELS = {
 SPLIT_CHANNELS = {"nadesouthere"}
 
 CUTOFF      = dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=18 * 30)
+# YouTube timestamps are always "YYYY-MM-DDTHH:MM:SSZ", which sorts
+# lexicographically, so publishedAt is compared as a plain string.
+CUTOFF_STR  = CUTOFF.strftime("%Y-%m-%dT%H:%M:%SZ")
 MIN_VIDEOS  = 10
 SHORTS_MAXS = 60   # seconds; videos at or under this are treated as shorts
 
-MAPS = {"mirage","inferno","nuke","ancient","anubis","vertigo","overpass","dust2"}
+VIDEOS_OUT   = Path("docs/data/videos.json")
+FULL_REBUILD = os.getenv("FULL_REBUILD") == "1"
+
+MAPS = frozenset({"mirage","inferno","nuke","ancient","anubis","vertigo","overpass","dust2"})
+# Built from MAPS once at import: one pass over the lowercased title instead
+# of a substring scan per map. "dust 2" is folded into dust2 by detect_map.
+MAP_RE = re.compile("|".join(sorted(MAPS - {"dust2"})) + r"|dust\s*2")
 BLACKLIST = MAPS | {"faceit","pov","demo","highlights","highlight","ranked","cs2","vs","clutch"}
 
 # Known CS2 pro team name tokens — prevents the fallback from picking up a
 # team prefix (e.g. "Falcons Niko …") as the player name.
-CS2_TEAM_TOKENS = {
+CS2_TEAM_TOKENS = frozenset({
     "falcons","vitality","faze","navi","heroic","mouz","ence","liquid",
     "cloud9","spirit","astralis","nip","mibr","complexity","aurora","apeks",
     "imperial","fluxo","fnatic","mongols","mongolz","saw","monte","rebels",
     "grayhound","tyloo","outsiders","gambit","gamerlegion","passion","lynn",
     "big","og","virtus","mousesports","ninjas","pyjamas","col","pain",
     "eternafire","9ine","nine","furia","team","esports","gaming","clan",
-}
+})
 
 FALLBACK_STOP_WORDS = BLACKLIST | CS2_TEAM_TOKENS | {
     "ft","with","the","in","on","at","by","for","to","of","and","or",
@@ -63,15 +86,78 @@ FALLBACK_STOP_WORDS = BLACKLIST | CS2_TEAM_TOKENS | {
     "round","epic","csgo","esea","major","open","cup","lan",
 }
 TOKEN = re.compile(r"[A-Za-z0-9_\-]{3,16}")
+# ISO-8601 video duration; YouTube adds a day part past 24h ("P1DT2H3M4S").
+DUR_RE = re.compile(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
 
 HLTV_API_BASE = "https://hltv-api.onrender.com/api"
 
+# Shared keep-alive session for HLTV. The API sits on a free host that
+# cold-starts and rate-limits, so retry 429/5xx with exponential back-off.
+HTTP = requests.Session()
+HTTP.mount("https://", HTTPAdapter(max_retries=Retry(
+    total=4, backoff_factor=2, status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET"}),
+)))
+
+# Last good HLTV roster, committed alongside videos.json by the workflow.
+# Reused for TEAMS_TTL, and past that whenever the live API is down.
+TEAMS_CACHE = Path("docs/data/teams.json")
+TEAMS_TTL   = dt.timedelta(days=7)
+
+# handle → uploads playlist ID. Handles never move, so entries never expire;
+# delete one to force it to be re-resolved.
+CHANNEL_CACHE = Path("docs/data/channels.json")
+
+# Partial-response masks: only ask YouTube for the fields we actually read.
+PL_FIELDS  = "nextPageToken,items(snippet(publishedAt,title,resourceId/videoId))"
+DUR_FIELDS = "items(id,contentDetails/duration)"
+
+# ── Output ────────────────────────────────────────────────────────────────
+def write_json(path: Path, data, **dump_kw) -> None:
+    """Stream data to a sibling temp file, then swap it in atomically so the
+    site (or a crashed run) never leaves a half-written file behind."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w") as f:
+        json.dump(data, f, indent=2, **dump_kw)
+    tmp.replace(path)
+
 # ── HLTV whitelist ────────────────────────────────────────────────────────
+def load_team_cache() -> tuple[dict[str, str], dt.datetime | None]:
+    """Returns (nick_to_team, fetched_at) from TEAMS_CACHE, or ({}, None)."""
+    try:
+        raw = json.loads(TEAMS_CACHE.read_text())
+        return dict(raw["players"]), dt.datetime.fromisoformat(raw["fetched"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}, None
+
+def save_team_cache(nick_to_team: dict[str, str]) -> None:
+    write_json(TEAMS_CACHE, {
+        "fetched": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "players": nick_to_team,
+    }, sort_keys=True)
+
 def fetch_team_data() -> tuple[set[str], dict[str, str]]:
+    """Returns (whitelist, nick_to_team), preferring a fresh TEAMS_CACHE."""
+    cached, fetched = load_team_cache()
+    if cached and fetched and dt.datetime.now(dt.timezone.utc) - fetched < TEAMS_TTL:
+        print(f"[info] using cached HLTV roster from {fetched:%Y-%m-%d}")
+        return set(cached), cached
+
+    whitelist, nick_to_team = fetch_team_data_live()
+    if whitelist:
+        save_team_cache(nick_to_team)
+        return whitelist, nick_to_team
+    if cached:
+        print(f"[warn] HLTV unavailable — using stale roster from {fetched:%Y-%m-%d}")
+        return set(cached), cached
+    return whitelist, nick_to_team
+
+def fetch_team_data_live() -> tuple[set[str], dict[str, str]]:
     """Returns (whitelist, nick_to_team). Handles multiple API response shapes."""
     url = f"{HLTV_API_BASE}/ranking?type=team&offset=0"
     try:
-        resp = requests.get(url, timeout=12)
+        resp = HTTP.get(url, timeout=12)
         resp.raise_for_status()
         raw  = resp.json()
         data = raw.get("data", raw) if isinstance(raw, dict) else raw
@@ -99,14 +185,43 @@ def fetch_team_data() -> tuple[set[str], dict[str, str]]:
         print(f"[warn] HLTV API fetch failed: {e}")
         return set(), {}
 
-def extract_fallback_player(title: str) -> str | None:
-    """First title token that looks like a player name (used when whitelist unavailable)."""
-    for tok in TOKEN.findall(title):
-        if tok.lower() not in FALLBACK_STOP_WORDS and not tok.isdigit():
+def extract_fallback_player(lower: str) -> str | None:
+    """First token of a lowercased title that looks like a player name (used
+    when whitelist unavailable)."""
+    for m in TOKEN.finditer(lower):
+        tok = m.group(0)
+        if tok not in FALLBACK_STOP_WORDS and not tok.isdigit():
             return tok
     return None
 
+def build_nick_re(whitelist: set[str]) -> re.Pattern | None:
+    """One alternation over the whitelist that matches a whole title token.
+
+    Longest nicks come first; the lookarounds mirror TOKEN's character class
+    so a nick only matches when it is the entire token, as before. The
+    pattern is lowercase and case-sensitive: search a lowercased title.
+    """
+    nicks = sorted({n.lower() for n in whitelist
+                    if TOKEN.fullmatch(n) and n.lower() not in BLACKLIST},
+                   key=len, reverse=True)
+    if not nicks:
+        return None
+    return re.compile(r"(?<![A-Za-z0-9_\-])(?:" + "|".join(map(re.escape, nicks))
+                      + r")(?![A-Za-z0-9_\-])")
+
 # ── YouTube helpers ───────────────────────────────────────────────────────
+def load_channel_cache() -> dict[str, str]:
+    try:
+        return dict(json.loads(CHANNEL_CACHE.read_text()))
+    except (OSError, ValueError, TypeError):
+        return {}
+
+def youtube_client():
+    """A fresh client per thread, built from the discovery doc bundled with
+    googleapiclient — no discovery round-trip and no discovery-cache probe."""
+    return build("youtube", "v3", developerKey=YT_KEY,
+                 static_discovery=True, cache_discovery=False)
+
 def chan_id(y, handle_or_id: str) -> str | None:
     if handle_or_id.startswith("UC"):
         return handle_or_id
@@ -114,145 +229,245 @@ def chan_id(y, handle_or_id: str) -> str | None:
                         part="snippet", maxResults=1).execute()
     return r["items"][0]["id"]["channelId"] if r["items"] else None
 
-def uploads_pl(y, cid: str) -> str | None:
-    r = y.channels().list(id=cid, part="contentDetails").execute()
-    if r["items"]:
+def uploads_pl(y, handle_or_id: str) -> str | None:
+    """Uploads playlist for a channel ID or @handle.
+
+    Handles go through channels.list(forHandle=…), 1 quota unit for ID and
+    playlist together; the 100-unit search.list is only a fallback.
+    """
+    if handle_or_id.startswith("UC"):
+        r = y.channels().list(id=handle_or_id, part="contentDetails").execute()
+    else:
+        r = y.channels().list(forHandle=handle_or_id, part="contentDetails").execute()
+        if not r.get("items"):
+            cid = chan_id(y, handle_or_id)
+            if not cid:
+                return None
+            r = y.channels().list(id=cid, part="contentDetails").execute()
+    if r.get("items"):
         return r["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
 
-def walk_pl_pages(y, pl_id: str):
-    tok = None
-    while True:
-        r = y.playlistItems().list(playlistId=pl_id, part="snippet",
-                                   maxResults=50, pageToken=tok).execute()
-        items = r.get("items", [])
-        if items:
-            yield items
-        if items:
-            oldest = min(isoparse(it["snippet"]["publishedAt"]) for it in items)
-            if oldest < CUTOFF:
-                break
-        tok = r.get("nextPageToken")
-        if not tok:
-            break
+def walk_pl_pages(pl_id: str, stop: str = CUTOFF_STR):
+    """Yield playlist pages newest first, ending with the page that crosses stop.
+
+    The next page is requested on a helper thread while the caller works on
+    the current one (its durations lookup is a round-trip of its own). The
+    helper gets its own client because httplib2 is not thread-safe.
+    """
+    pager = youtube_client()
+
+    def fetch(tok: str | None) -> dict:
+        return pager.playlistItems().list(playlistId=pl_id, part="snippet",
+                                          maxResults=50, pageToken=tok,
+                                          fields=PL_FIELDS).execute()
+
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = prefetch.submit(fetch, None)
+        while pending:
+            r     = pending.result()
+            items = r.get("items", [])
+            tok   = r.get("nextPageToken")
+            done  = bool(items) and min(it["snippet"]["publishedAt"]
+                                        for it in items) < stop
+            pending = prefetch.submit(fetch, tok) if tok and not done else None
+            if items:
+                yield items
 
 def duration_to_seconds(iso_dur: str) -> int:
-    m = re.fullmatch(r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?", iso_dur or "")
+    m = DUR_RE.fullmatch(iso_dur or "")
     if not m:
         return 0
-    return int(m.group(1) or 0) * 3600 + int(m.group(2) or 0) * 60 + int(m.group(3) or 0)
+    d, h, mi, sec = (int(g or 0) for g in m.groups())
+    return ((d * 24 + h) * 60 + mi) * 60 + sec
 
 def fetch_durations(y, ids: list[str]) -> dict[str, int]:
     out: dict[str, int] = {}
     if not ids:
         return out
-    resp = y.videos().list(id=",".join(ids), part="contentDetails").execute()
+    resp = y.videos().list(id=",".join(ids), part="contentDetails",
+                           fields=DUR_FIELDS).execute()
     for it in resp.get("items", []):
         out[it["id"]] = duration_to_seconds(it["contentDetails"]["duration"])
     return out
 
-def detect_map(title: str) -> str | None:
-    normalized = re.sub(r"\bdust\s*2\b", "dust2", title, flags=re.IGNORECASE)
-    lower = normalized.lower()
-    return next((m for m in MAPS if m in lower), None)
+def detect_map(lower: str) -> str | None:
+    m = MAP_RE.search(lower)
+    if not m:
+        return None
+    name = m.group(0)
+    return "dust2" if name.startswith("dust") else name
+
+# ── Channel scan ──────────────────────────────────────────────────────────
+def scan_uploads(yt, label: str, upl: str, stop: str) -> list[dict]:
+    """Rows for the uploads in playlist upl published at or after stop."""
+    is_split = label in SPLIT_CHANNELS
+    rows: list[dict] = []
+
+    for page in walk_pl_pages(upl, stop):
+        # Only in-window items are worth a durations lookup (the last page
+        # usually straddles stop), and a #shorts title settles it without one.
+        fresh     = [(sn, sn["title"].lower()) for sn in (it["snippet"] for it in page)
+                     if sn["publishedAt"] >= stop]
+        durations = fetch_durations(yt, [sn["resourceId"]["videoId"]
+                                         for sn, lower in fresh if "#shorts" not in lower])
+
+        for sn, lower in fresh:
+            vid = sn["resourceId"]["videoId"]
+            pub = sn["publishedAt"]
+
+            title    = sn["title"]
+            is_short = "#shorts" in lower or durations.get(vid, 0) <= SHORTS_MAXS
+
+            if is_split:
+                # Strategy/utility channel: keep both; split by duration
+                channel  = "utility" if is_short else "strategy"
+                game_map = detect_map(lower)
+                if not game_map:
+                    continue   # skip unrecognised maps for this channel
+
+            else:
+                # POV channel: skip shorts; player is detected later
+                if is_short:
+                    continue
+
+                channel  = label
+                game_map = detect_map(lower)
+
+            rows.append({
+                "id":        vid,
+                "title":     title,
+                "channel":   channel,
+                "player":    None,
+                "team":      None,
+                "map":       game_map,
+                "published": pub[:10],
+            })
+    return rows
+
+def scan_channel(label: str, handle: str, uploads: dict[str, str],
+                 known: list[dict]) -> list[dict]:
+    """All in-window uploads of one channel as output rows.
+
+    known holds this channel's rows from the previous run. Only uploads from
+    the newest known day onwards are fetched; the rest of known is carried
+    over. Player and team are left empty; main() stamps them once the HLTV
+    roster is in.
+
+    A cached uploads playlist that 404s is dropped and resolved again once;
+    if the channel still cannot be scanned, its previous rows are kept.
+
+    Runs on a worker thread; the googleapiclient HTTP object is not
+    thread-safe, so each call builds its own client.
+    """
+    yt    = youtube_client()
+    known = [v for v in known if v["published"] >= CUTOFF_STR[:10]]  # age out
+
+    # "YYYY-MM-DD" sorts before any timestamp on that day, so the newest
+    # known day is fetched again in full.
+    stop = max(CUTOFF_STR, max((v["published"] for v in known), default=""))
+
+    for _ in range(2):
+        upl = uploads.get(handle) or uploads_pl(yt, handle)
+        if not upl:
+            print(f"[warn] no uploads playlist for {handle!r} — keeping previous rows")
+            return known
+        uploads[handle] = upl
+        try:
+            rows = scan_uploads(yt, label, upl, stop)
+            break
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            print(f"[warn] uploads playlist {upl!r} for {handle!r} not found")
+            uploads.pop(handle, None)
+    else:
+        print(f"[warn] cannot scan {handle!r} — keeping previous rows")
+        return known
+
+    fetched = {v["id"] for v in rows}
+    return rows + [v for v in known if v["id"] not in fetched]
+
+def load_previous() -> dict[str, list[dict]]:
+    """Last run's rows grouped by CHANNELS label, player/team cleared.
+
+    Split channels share the utility/strategy labels, so their rows can only
+    be attributed (and the channel scanned incrementally) when there is one.
+    """
+    if FULL_REBUILD:
+        return {}
+    try:
+        previous = json.loads(VIDEOS_OUT.read_text())
+    except (OSError, ValueError):
+        return {}
+    split_owner = next(iter(SPLIT_CHANNELS)) if len(SPLIT_CHANNELS) == 1 else None
+    known: dict[str, list[dict]] = defaultdict(list)
+    for v in previous:
+        if v["channel"] in ("utility", "strategy"):
+            label = split_owner
+        else:
+            label = v["channel"] if v["channel"] in CHANNELS else None
+        if label:
+            known[label].append(dict(v, player=None, team=None))
+    return known
 
 # ── Main ──────────────────────────────────────────────────────────────────
 def main() -> None:
-    whitelist, nick_to_team = fetch_team_data()
-    whitelist_lc   = {n.lower() for n in whitelist}
+    # Phase 1: the HLTV roster and every channel scan are independent and
+    # network-bound, so run them side by side. Rows are merged in CHANNELS
+    # order so the output stays stable.
+    cached  = load_channel_cache()
+    uploads = dict(cached)
+    known   = load_previous()
+    with ThreadPoolExecutor(max_workers=len(CHANNELS) + 1) as pool:
+        roster  = pool.submit(fetch_team_data)
+        futures = [pool.submit(scan_channel, label, handle, uploads, known.get(label, []))
+                   for label, handle in CHANNELS.items()]
+        vids    = [v for fut in futures for v in fut.result()]
+        whitelist, nick_to_team = roster.result()
+    if uploads != cached:
+        write_json(CHANNEL_CACHE, uploads, sort_keys=True)
+
     canonical      = {n.lower(): n for n in whitelist}  # lower → HLTV canonical casing
-    using_fallback = not whitelist_lc
+    nick_re        = build_nick_re(whitelist)
+    using_fallback = not whitelist
     if using_fallback:
         print("[info] HLTV whitelist empty — using title-based player fallback")
 
-    yt = build("youtube", "v3", developerKey=YT_KEY)
-    vids, counter = [], Counter()
-
-    for label, handle in CHANNELS.items():
-        is_split = label in SPLIT_CHANNELS
-
-        cid = chan_id(yt, handle)
-        if not cid:
-            print(f"[warn] cannot resolve {handle!r}")
-            continue
-        upl = uploads_pl(yt, cid)
-        if not upl:
-            print(f"[warn] no uploads playlist for {handle!r}")
+    # Phase 2: pure lookups — stamp player/team onto the POV rows, carried-over
+    # ones included, so MIN_VIDEOS counts always cover the whole catalogue.
+    pov_channels = CHANNELS.keys() - SPLIT_CHANNELS
+    by_player: dict[str, list[dict]] = defaultdict(list)
+    for v in vids:
+        if v["channel"] not in pov_channels:
             continue
-
-        for page in walk_pl_pages(yt, upl):
-            ids       = [it["snippet"]["resourceId"]["videoId"] for it in page]
-            durations = fetch_durations(yt, ids)
-
-            for it in page:
-                vid = it["snippet"]["resourceId"]["videoId"]
-                pub = isoparse(it["snippet"]["publishedAt"])
-                if pub < CUTOFF:
-                    continue
-
-                title    = it["snippet"]["title"]
-                is_short = ("#shorts" in title.lower()
-                            or durations.get(vid, 0) <= SHORTS_MAXS)
-
-                if is_split:
-                    # Strategy/utility channel: keep both; split by duration
-                    channel  = "utility" if is_short else "strategy"
-                    game_map = detect_map(title)
-                    if not game_map:
-                        continue   # skip unrecognised maps for this channel
-                    nick = None
-                    team = None
-
-                else:
-                    # POV channel: skip shorts, detect player
-                    if is_short:
-                        continue
-
-                    channel  = label
-                    game_map = detect_map(title)
-
-                    if using_fallback:
-                        raw_tok = extract_fallback_player(title)
-                        nick    = raw_tok.lower() if raw_tok else None
-                        team    = None
-                    else:
-                        tokens = TOKEN.findall(title)
-                        match  = next(
-                            (t for t in tokens
-                             if t.lower() in whitelist_lc and t.lower() not in BLACKLIST),
-                            None,
-                        )
-                        nick = canonical.get(match.lower()) if match else None
-                        team = nick_to_team.get(nick) if nick else None
-
-                if nick:
-                    counter[nick] += 1
-
-                vids.append({
-                    "id":        vid,
-                    "title":     title,
-                    "channel":   channel,
-                    "player":    nick,
-                    "team":      team,
-                    "map":       game_map,
-                    "published": pub.isoformat()[:10],
-                })
+        lower = v["title"].lower()
+        if using_fallback:
+            nick = extract_fallback_player(lower)
+        else:
+            match     = nick_re.search(lower) if nick_re else None
+            nick      = canonical.get(match.group(0)) if match else None
+            v["team"] = nick_to_team.get(nick) if nick else None
+        if nick:
+            v["player"] = nick
+            by_player[nick].append(v)
 
     # Drop POV players that appear in fewer than MIN_VIDEOS videos
-    keep = {p for p, n in counter.items() if n >= MIN_VIDEOS}
-    for v in vids:
-        if v.get("player") and v["player"] not in keep:
-            v["player"] = None
-
-    vids.sort(key=lambda v: v["published"], reverse=True)
-
-    out_dir = Path("docs/data")
-    out_dir.mkdir(parents=True, exist_ok=True)
-    (out_dir / "videos.json").write_text(json.dumps(vids, indent=2))
-
-    strategy_n = sum(1 for v in vids if v["channel"] == "strategy")
-    utility_n  = sum(1 for v in vids if v["channel"] == "utility")
-    print(f"[info] wrote {len(vids)} videos "
-          f"({len(keep)} players, {strategy_n} strategy, {utility_n} utility)")
+    # (only their own rows are touched — no second sweep over every video)
+    keep = set()
+    for nick, rows in by_player.items():
+        if len(rows) >= MIN_VIDEOS:
+            keep.add(nick)
+        else:
+            for v in rows:
+                v["player"] = None
+
+    vids.sort(key=itemgetter("published"), reverse=True)
+
+    write_json(VIDEOS_OUT, vids)
+
+    per_channel = Counter(v["channel"] for v in vids)
+    print(f"[info] wrote {len(vids)} videos ({len(keep)} players, "
+          f"{per_channel['strategy']} strategy, {per_channel['utility']} utility)")
 
 if __name__ == "__main__":
     main()